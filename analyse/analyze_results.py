@@ -1,17 +1,16 @@
 """
 Script pour afficher un résumé des résultats depuis InfluxDB
-Usage: python analyze_results.py
+Usage: python analyze_results.py [--no-cache]
 """
 
 from influxdb_client import InfluxDBClient
 from dotenv import load_dotenv
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import os
-from datetime import datetime
+import sys
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-import plotly.offline as pyo
 
 load_dotenv()
 
@@ -22,7 +21,7 @@ INFLUX_ORG = os.getenv("INFLUX_ORG", "ensa")
 INFLUX_BUCKET = os.getenv("INFLUX_BUCKET", "bench")
 
 # Initialize InfluxDB client
-client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, enable_gzip=True)
 query_api = client.query_api()
 
 # Database names
@@ -57,124 +56,199 @@ SCENARIOS = {
     }
 }
 
+# Flux set literals, built once
+DATABASE_SET = ", ".join(f'"{db}"' for db in DATABASES)
+SCENARIO_SET = ", ".join(f'"{key}"' for key in SCENARIOS)
+
+def _field_format(field):
+    """Pick the display format of a field from its name"""
+    if 'time' in field:
+        return "{:.4f}s"
+    elif 'latency' in field:
+        return "{:.4f}ms"
+    elif 'throughput' in field:
+        return "{:.0f} ops/sec"
+    elif 'percent' in field or 'cpu' in field or 'mem' in field:
+        return "{:.2f}%"
+    return "{:.2f}"
+
+# Display format of every scenario field, resolved once
+FIELD_FORMAT = {field: _field_format(field)
+                for info in SCENARIOS.values() for field in info['fields']}
+
+# Complete output line templates, for operation records (CRUD) and plain records
+OPERATION_LINE_TEMPLATES = {field: f"      • {field}: {fmt}" for field, fmt in FIELD_FORMAT.items()}
+RECORD_LINE_TEMPLATES = {field: f"    • {field}: {fmt}" for field, fmt in FIELD_FORMAT.items()}
+
+# Separator lines, built once
+SEP_EQ = "=" * 80
+SEP_DASH = "-" * 80
+
+def format_header(title):
+    """Format a header block"""
+    return f"\n{SEP_EQ}\n  {title}\n{SEP_EQ}"
+
+def format_separator():
+    """Format a separator line"""
+    return SEP_DASH
+
 def print_header(title):
     """Print a formatted header"""
-    print("\n" + "="*80)
-    print(f"  {title}")
-    print("="*80)
+    print(format_header(title))
 
 def print_separator():
     """Print a separator line"""
-    print("-"*80)
+    print(format_separator())
+
+def write_lines(lines):
+    """Write buffered output lines with a single call"""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+# Flux steps reducing each pivoted series to its first row, with the series row count in _count
+FIRST_ROW_WITH_COUNT = '''
+      |> sort(columns: ["_time"], desc: true)
+      |> map(fn: (r) => ({r with _count: 1}))
+      |> cumulativeSum(columns: ["_count"])
+      |> last(column: "_count")'''
+
+# Query results memoized by (scenario, time range)
+_CACHE = {}
+use_cache = True
+
+def _concat_frames(frames):
+    """Merge the per-table DataFrames of a Flux result into a single one"""
+    frames = list(frames)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def load_all_scenarios(time_range="-24h"):
+    """Query all scenarios in a single Flux request and cache them by scenario"""
+    query = f'''
+    from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: {time_range})
+      |> filter(fn: (r) => contains(value: r["_measurement"], set: [{SCENARIO_SET}]))
+      |> filter(fn: (r) => contains(value: r["database"], set: [{DATABASE_SET}]))
+      |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value"){FIRST_ROW_WITH_COUNT}
+    '''
+    
+    # Each streamed frame is one CSV schema block, which can span several measurements
+    frames = defaultdict(list)
+    try:
+        for block_df in query_api.query_data_frame_stream(query, org=INFLUX_ORG):
+            for measurement, group in block_df.groupby('_measurement', sort=False):
+                frames[measurement].append(group)
+    except Exception as e:
+        print(f"    ⚠️  Error querying scenarios: {e}")
+        return
+    
+    for key in SCENARIOS:
+        _CACHE[(key, time_range)] = _concat_frames(frames[key])
 
 def query_scenario_data(scenario_name, time_range="-24h"):
     """Query data for a specific scenario from InfluxDB"""
+    cache_key = (scenario_name, time_range)
+    if cache_key in _CACHE:
+        return _CACHE[cache_key]
+    
     query = f'''
     from(bucket: "{INFLUX_BUCKET}")
       |> range(start: {time_range})
       |> filter(fn: (r) => r["_measurement"] == "{scenario_name}")
-      |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> filter(fn: (r) => contains(value: r["database"], set: [{DATABASE_SET}]))
+      |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value"){FIRST_ROW_WITH_COUNT}
     '''
     
     try:
-        tables = query_api.query(query, org=INFLUX_ORG)
-        results = []
-        for table in tables:
-            for record in table.records:
-                results.append(record.values)
-        return results
+        df = _concat_frames(query_api.query_data_frame_stream(query, org=INFLUX_ORG))
     except Exception as e:
         print(f"    ⚠️  Error querying {scenario_name}: {e}")
-        return []
+        return pd.DataFrame()
+    
+    if use_cache:
+        _CACHE[cache_key] = df
+    return df
 
-def analyze_scenario(scenario_key, scenario_info):
-    """Analyze and display results for a single scenario"""
-    print_header(f"📊 {scenario_info['name']} ({scenario_key})")
+def load_all(time_range="-24h"):
+    """Load the first record of every scenario, indexed by database (and operation)"""
+    if use_cache:
+        load_all_scenarios(time_range)
     
-    data = query_scenario_data(scenario_key)
+    # Cache hits return immediately, misses are queried concurrently
+    with ThreadPoolExecutor(max_workers=len(SCENARIOS)) as executor:
+        futures = {key: executor.submit(query_scenario_data, key, time_range) for key in SCENARIOS}
+        frames = {key: future.result() for key, future in futures.items()}
     
-    if not data:
-        print("    ⚠️  No data found for this scenario")
+    for key, df in frames.items():
+        if not df.empty:
+            index = ['database', 'operation'] if 'operations' in SCENARIOS[key] else ['database']
+            frames[key] = df.set_index(index).reindex(columns=SCENARIOS[key]['fields'] + ['_count'])
+    return frames
+
+def analyze_scenario(scenario_key, scenario_info, data):
+    """Analyze and display results for a single scenario"""
+    out = [format_header(f"📊 {scenario_info['name']} ({scenario_key})")]
+    
+    if data.empty:
+        out.append("    ⚠️  No data found for this scenario")
+        write_lines(out)
         return
     
-    print(f"\n    Found {len(data)} measurement(s)\n")
+    out.append(f"\n    Found {data['_count'].sum()} measurement(s)\n")
     
-    # Group by database
-    db_results = {}
-    for record in data:
-        db_name = record.get('database', 'Unknown')
-        if db_name not in db_results:
-            db_results[db_name] = []
-        db_results[db_name].append(record)
+    # One record per database (and per operation, like CRUD), as named tuples
+    records = {rec.Index: rec for rec in data.itertuples()}
+    databases = set(data.index.get_level_values('database'))
     
     # Display results by database
     for db_name in DATABASES:
-        if db_name in db_results:
-            print(f"\n  🔹 {db_name}")
-            print_separator()
+        if db_name in databases:
+            out.append(f"\n  🔹 {db_name}")
+            out.append(format_separator())
             
             # If scenario has operations (like CRUD)
             if 'operations' in scenario_info:
-                ops = {}
-                for record in db_results[db_name]:
-                    op = record.get('operation', 'unknown')
-                    if op not in ops:
-                        ops[op] = record
-                
                 for op in scenario_info['operations']:
-                    if op in ops:
-                        rec = ops[op]
-                        print(f"\n    {op.upper()}:")
+                    rec = records.get((db_name, op))
+                    if rec is not None:
+                        out.append(f"\n    {op.upper()}:")
                         for field in scenario_info['fields']:
-                            value = rec.get(field)
-                            if value is not None:
-                                if 'time' in field:
-                                    print(f"      • {field}: {value:.4f}s")
-                                elif 'latency' in field:
-                                    print(f"      • {field}: {value:.4f}ms")
-                                elif 'percent' in field or 'cpu' in field or 'mem' in field:
-                                    print(f"      • {field}: {value:.2f}%")
-                                else:
-                                    print(f"      • {field}: {value:.2f}")
+                            value = getattr(rec, field)
+                            if pd.notna(value):
+                                out.append(OPERATION_LINE_TEMPLATES[field].format(value))
             else:
                 # For scenarios without operations
-                for record in db_results[db_name]:
-                    for field in scenario_info['fields']:
-                        value = record.get(field)
-                        if value is not None:
-                            if 'time' in field:
-                                print(f"    • {field}: {value:.4f}s")
-                            elif 'latency' in field:
-                                print(f"    • {field}: {value:.4f}ms")
-                            elif 'throughput' in field:
-                                print(f"    • {field}: {value:.0f} ops/sec")
-                            elif 'percent' in field or 'cpu' in field or 'mem' in field:
-                                print(f"    • {field}: {value:.2f}%")
-                            else:
-                                print(f"    • {field}: {value:.2f}")
-                    break  # Only show first record for non-operation scenarios
+                rec = records[db_name]
+                for field in scenario_info['fields']:
+                    value = getattr(rec, field)
+                    if pd.notna(value):
+                        out.append(RECORD_LINE_TEMPLATES[field].format(value))
+    
+    write_lines(out)
 
-def compare_databases(scenario_key, metric, operation=None):
-    """Compare a specific metric across all databases"""
-    data = query_scenario_data(scenario_key)
+def query_metric_by_db(scenario_key, metric, operation=None, descending=False, limit=10, time_range="-24h"):
+    """Query the mean of a metric per database, ranked by InfluxDB"""
+    operation_filter = f' and r["operation"] == "{operation}"' if operation else ""
+    query = f'''
+    from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: {time_range})
+      |> filter(fn: (r) => r["_measurement"] == "{scenario_key}" and r["_field"] == "{metric}"{operation_filter})
+      |> filter(fn: (r) => contains(value: r["database"], set: [{DATABASE_SET}]))
+      |> group(columns: ["database"])
+      |> mean(column: "_value")
+      |> group()
+      |> sort(columns: ["_value"], desc: {str(descending).lower()})
+      |> limit(n: {limit})
+    '''
     
-    if not data:
+    tables = query_api.query(query, org=INFLUX_ORG)
+    return {record['database']: record.get_value() for table in tables for record in table.records}
+
+def compare_databases(scenario_key, metric, operation=None, descending=False):
+    """Compare a specific metric across all databases, best first"""
+    try:
+        return query_metric_by_db(scenario_key, metric, operation, descending)
+    except Exception as e:
+        print(f"    ⚠️  Error comparing {metric} for {scenario_key}: {e}")
         return None
-    
-    results = {}
-    for record in data:
-        db_name = record.get('database')
-        if operation:
-            if record.get('operation') == operation:
-                value = record.get(metric)
-                if value is not None:
-                    results[db_name] = value
-        else:
-            value = record.get(metric)
-            if value is not None:
-                results[db_name] = value
-    
-    return results
 
 def display_comparison():
     """Display key comparisons between databases"""
@@ -188,16 +262,14 @@ def display_comparison():
     ]
     
     for scenario, metric, operation, title in comparisons:
-        results = compare_databases(scenario, metric, operation)
+        # Results come back already ranked by InfluxDB
+        descending = "throughput" in metric or "Higher" in title
+        results = compare_databases(scenario, metric, operation, descending)
         if results:
             print(f"\n  📈 {title}")
             print_separator()
             
-            # Sort results
-            sorted_results = sorted(results.items(), key=lambda x: x[1], 
-                                   reverse=("throughput" in metric or "Higher" in title))
-            
-            for i, (db, value) in enumerate(sorted_results, 1):
+            for i, (db, value) in enumerate(results.items(), 1):
                 if "throughput" in metric:
                     print(f"    {i}. {db:12s} : {value:>10.0f} ops/sec")
                 elif "latency" in metric or "time" in metric:
@@ -206,67 +278,87 @@ def display_comparison():
                     print(f"    {i}. {db:12s} : {value:>10.2f}")
 
 
-def display_summary():
-    """Display overall summary"""
-    print_header("📋 BENCHMARK SUMMARY")
+def display_summary(frames):
+    """Display overall summary and return the scenarios with data"""
+    out = [format_header("📋 BENCHMARK SUMMARY")]
     
     total_measurements = 0
     scenarios_with_data = []
     
-    for scenario_key in SCENARIOS.keys():
-        data = query_scenario_data(scenario_key)
-        if data:
-            total_measurements += len(data)
+    for scenario_key, data in frames.items():
+        if not data.empty:
+            total_measurements += data['_count'].sum()
             scenarios_with_data.append(scenario_key)
     
-    print(f"\n  • Total scenarios with data: {len(scenarios_with_data)}/{len(SCENARIOS)}")
-    print(f"  • Total measurements: {total_measurements}")
-    print(f"  • Databases tested: {', '.join(DATABASES)}")
-    print(f"  • InfluxDB Bucket: {INFLUX_BUCKET}")
-    print(f"  • Organization: {INFLUX_ORG}")
+    out.append(f"\n  • Total scenarios with data: {len(scenarios_with_data)}/{len(SCENARIOS)}")
+    out.append(f"  • Total measurements: {total_measurements}")
+    out.append(f"  • Databases tested: {', '.join(DATABASES)}")
+    out.append(f"  • InfluxDB Bucket: {INFLUX_BUCKET}")
+    out.append(f"  • Organization: {INFLUX_ORG}")
     
     if scenarios_with_data:
-        print(f"\n  Scenarios with data:")
+        out.append("\n  Scenarios with data:")
         for scenario in scenarios_with_data:
-            print(f"    ✅ {SCENARIOS[scenario]['name']} ({scenario})")
+            out.append(f"    ✅ {SCENARIOS[scenario]['name']} ({scenario})")
     
     missing_scenarios = set(SCENARIOS.keys()) - set(scenarios_with_data)
     if missing_scenarios:
-        print(f"\n  Scenarios without data:")
+        out.append("\n  Scenarios without data:")
         for scenario in missing_scenarios:
-            print(f"    ⚠️  {SCENARIOS[scenario]['name']} ({scenario})")
+            out.append(f"    ⚠️  {SCENARIOS[scenario]['name']} ({scenario})")
+    
+    write_lines(out)
+    return set(scenarios_with_data)
 
 def generate_pdf_report():
     """Generate PDF report if the generate_professional_pdf_report.py script exists"""
-    import os
-    if os.path.exists("generate_professional_pdf_report.py"):
-        try:
-            import subprocess
-            result = subprocess.run(["python", "generate_professional_pdf_report.py"], 
-                                  capture_output=True, text=True, timeout=60)
-            if result.returncode == 0:
-                print("  📄 PDF Report: rapport_benchmark_nosql_professionnel.pdf")
-            else:
-                print(f"  ⚠️  PDF generation failed: {result.stderr}")
-        except Exception as e:
-            print(f"  ⚠️  Could not generate PDF report: {e}")
-    else:
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate_professional_pdf_report.py")
+    if not os.path.exists(script):
         print("  ℹ️  PDF generation script not found")
+        return
+    
+    # Run the generator in this interpreter, reusing the already-open client
+    try:
+        import generate_professional_pdf_report as pdfgen
+    except ImportError as e:
+        print(f"  ⚠️  Could not generate PDF report: {e}")
+        return
+    
+    try:
+        chemin = pdfgen.generer_rapport_pdf(client)
+        print(f"  📄 PDF Report: {chemin}")
+    except Exception as e:
+        print(f"  ⚠️  PDF generation failed: {e}")
 
 def main():
     """Main function to analyze all benchmark results"""
+    global use_cache
+    
+    parser = argparse.ArgumentParser(description="Display a summary of the benchmark results stored in InfluxDB")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="query InfluxDB on every access instead of reusing results")
+    args = parser.parse_args()
+    
     print("\n" + "#"*80)
     print("#" + " "*78 + "#")
     print("#" + " "*20 + "NOSQL BENCHMARK ANALYSIS" + " "*33 + "#")
     print("#" + " "*78 + "#")
     print("#"*80)
     
+    if args.no_cache:
+        use_cache = False
+        _CACHE.clear()
+    
+    # Fetch every scenario once
+    frames = load_all()
+    
     # Display summary first
-    display_summary()
+    scenarios_with_data = display_summary(frames)
     
-    # Analyze each scenario
+    # Analyze each scenario, the summary already lists those without data
     for scenario_key, scenario_info in SCENARIOS.items():
-        analyze_scenario(scenario_key, scenario_info)
+        if scenario_key in scenarios_with_data:
+            analyze_scenario(scenario_key, scenario_info, frames[scenario_key])
     
     # Display comparison
     display_comparison()
@@ -280,8 +372,8 @@ def main():
     # Footer
     print_header("✅ ANALYSIS COMPLETE")
     print(f"\n  💡 View detailed metrics at: {INFLUX_URL}")
-    print(f"  📊 Grafana Dashboard: http://localhost:3000")
-    print(f"  📄 PDF Report: Veuillez consulter le rapport dans le dossier results")
+    print("  📊 Grafana Dashboard: http://localhost:3000")
+    print("  📄 PDF Report: Veuillez consulter le rapport dans le dossier results")
     # Close client
     client.close()
 
@@ -11,8 +11,13 @@ from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 from datetime import datetime
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgba
 import numpy as np
+import atexit
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import io
 import os
 from influxdb_client import InfluxDBClient
@@ -27,14 +32,17 @@ INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
 INFLUX_ORG = os.getenv("INFLUX_ORG", "ensa")
 INFLUX_BUCKET = os.getenv("INFLUX_BUCKET", "bench")
 
-# Initialiser le client InfluxDB
-try:
-    client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-    query_api = client.query_api()
-    influx_available = True
-except Exception as e:
-    print(f"Avertissement: Impossible de se connecter à InfluxDB: {e}")
-    influx_available = False
+@functools.lru_cache(maxsize=1)
+def obtenir_client():
+    """Créer le client InfluxDB à la première requête, puis le réutiliser"""
+    try:
+        client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG,
+                                enable_gzip=True, timeout=30000, connection_pool_maxsize=20)
+    except Exception as e:
+        print(f"Avertissement: Impossible de se connecter à InfluxDB: {e}")
+        return None
+    atexit.register(client.close)
+    return client
 
 # Noms des bases de données
 BASES_DE_DONNEES = ["MongoDB", "Redis", "Cassandra", "Neo4j"]
@@ -74,6 +82,72 @@ SCENARIOS = {
     }
 }
 
+# Couleurs ReportLab construites une seule fois
+COULEUR_EN_TETE_TABLEAU = colors.HexColor('#4A90E2')
+COULEUR_LIGNE_ALTERNEE = colors.HexColor('#f9f9f9')
+COULEUR_GRILLE = colors.HexColor('#dddddd')
+COULEUR_GRILLE_CLAIRE = colors.HexColor('#eeeeee')
+COULEUR_SEPARATEUR = colors.HexColor('#cccccc')
+
+# Styles des tableaux, partagés par toutes les opérations et tous les scénarios
+STYLE_TABLEAU_CRUD = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), COULEUR_EN_TETE_TABLEAU),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, COULEUR_GRILLE_CLAIRE),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 5),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+    ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, COULEUR_LIGNE_ALTERNEE])
+])
+
+STYLE_TABLEAU_SCENARIO = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), COULEUR_EN_TETE_TABLEAU),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, COULEUR_GRILLE),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 5),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+    ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    # Alternance de couleurs pour les lignes
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, COULEUR_LIGNE_ALTERNEE])
+])
+
+# Largeurs de colonnes des tableaux, calculées une fois par scénario
+LARGEURS_COLONNES_CRUD = [1.2*inch] * 5
+LARGEURS_COLONNES = {
+    cle_scenario: [1.2*inch] + [1.5*inch] * len(info_scenario['champs'])
+    for cle_scenario, info_scenario in SCENARIOS.items()
+}
+LARGEURS_COLONNES["scenario2_iot"] = [1.2*inch, 1.1*inch, 1.3*inch, 1.3*inch, 1.0*inch, 1.0*inch]
+
+# Palettes de couleurs des graphiques par type de scénario, converties en RGBA
+PALETTES_GRAPHIQUES = {
+    cle: [to_rgba(couleur) for couleur in palette]
+    for cle, palette in {
+        "scenario1_crud": ['#3498db', '#2ecc71', '#e74c3c', '#f39c12'],  # Bleu, Vert, Rouge, Orange
+        "scenario2_iot": ['#9b59b6', '#1abc9c', '#34495e', '#d35400'],   # Violet, Turquoise, Gris foncé, Orange foncé
+        "scenario3_graph": ['#e74c3c', '#27ae60', '#8e44ad', '#f39c12'], # Rouge, Vert, Violet, Orange
+        "scenario4_keyvalue": ['#2c3e50', '#16a085', '#c0392b', '#7f8c8d'], # Noir, Vert foncé, Rouge foncé, Gris
+        "scenario5_fulltext": ['#2980b9', '#27ae60', '#8e44ad', '#f1c40f'], # Bleu, Vert, Violet, Jaune
+        "scenario6_scalability": ['#2c3e50', '#e74c3c', '#3498db', '#2ecc71'] # Noir, Rouge, Bleu, Vert
+    }.items()
+}
+PALETTE_PAR_DEFAUT = [to_rgba(couleur) for couleur in ['#4a4a4a', '#7a7a7a', '#a1a1a1', '#c9c9c9']]
+
+# Métadonnées minimales des PNG embarqués dans le rapport
+METADONNEES_PNG = {'Software': 'benchmark-nosql'}
+
 def formater_valeur_iot(valeur, champ):
     """Formater les valeurs pour le scénario IoT de manière spécifique"""
     if valeur is None:
@@ -98,122 +172,128 @@ def formater_valeur_iot(valeur, champ):
     else:
         return f"{valeur:.4f}"
 
-def interroger_donnees_scenario(nom_scenario, plage_temps="-24h"):
-    """Interroger les VRAIES données d'un scénario depuis InfluxDB"""
-    if not influx_available:
-        print(f"❌ InfluxDB non disponible pour {nom_scenario}")
-        return []
-        
-    requete = f'''
-    from(bucket: "{INFLUX_BUCKET}")
-      |> range(start: {plage_temps})
+def construire_pipeline_scenario(nom_scenario, source):
+    """Construire le pipeline Flux des moyennes d'un scénario par base (et opération)"""
+    info_scenario = SCENARIOS[nom_scenario]
+    champs = ", ".join(f'"{champ}"' for champ in info_scenario['champs'])
+    # Seul le scénario CRUD porte le tag "operation"
+    cles = '"database", "operation"' if 'operations' in info_scenario else '"database"'
+    
+    return f'''{source}
       |> filter(fn: (r) => r["_measurement"] == "{nom_scenario}")
-      |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
-    '''
+      |> filter(fn: (r) => contains(value: r["_field"], set: [{champs}]))
+      |> group(columns: ["_measurement", {cles}, "_field"])
+      |> mean()
+      |> pivot(rowKey: [{cles}], columnKey: ["_field"], valueColumn: "_value")'''
+
+def interroger_donnees_scenario(nom_scenario, plage_temps="-24h", client=None):
+    """Interroger les moyennes d'un scénario, calculées par InfluxDB pour chaque base (et opération)"""
+    client = client or obtenir_client()
+    if client is None:
+        print(f"❌ InfluxDB non disponible pour {nom_scenario}")
+        return
+    
+    source = f'''from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: {plage_temps})'''
+    requete = construire_pipeline_scenario(nom_scenario, source)
     
     try:
-        tables = query_api.query(requete, org=INFLUX_ORG)
-        resultats = []
-        for table in tables:
-            for record in table.records:
-                resultats.append(record.values)
-        
-        print(f"✅ Données récupérées pour {nom_scenario}: {len(resultats)} enregistrements")
-        return resultats
+        for record in client.query_api().query_stream(requete, org=INFLUX_ORG):
+            yield record.values
     except Exception as e:
         print(f"❌ Erreur lors de l'interrogation de {nom_scenario}: {e}")
-        return []
 
-def extraire_donnees_structurees(donnees_brutes):
-    """Structure les données brutes d'InfluxDB pour l'analyse"""
-    donnees_structurees = {}
+def interroger_tous_les_scenarios(plage_temps="-24h", client=None):
+    """Interroger les moyennes de tous les scénarios en une seule requête Flux"""
+    client = client or obtenir_client()
+    if client is None:
+        print("❌ InfluxDB non disponible")
+        return
+    
+    # Une branche par scénario, réunies avec union() dans la même requête
+    pipelines = ",\n".join(construire_pipeline_scenario(cle_scenario, "donnees") for cle_scenario in SCENARIOS)
+    requete = f'''
+    donnees = from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: {plage_temps})
     
-    for cle_scenario in SCENARIOS.keys():
-        donnees_structurees[cle_scenario] = []
-        
-        # Filtrer les données pour ce scénario
-        for record in donnees_brutes.get(cle_scenario, []):
-            donnee_struct = {}
-            
-            # Copier les champs pertinents
-            for champ in SCENARIOS[cle_scenario]['champs']:
-                if champ in record:
-                    donnee_struct[champ] = record[champ]
-            
-            # Ajouter le nom de la base de données
-            if 'database' in record:
-                donnee_struct['database'] = record['database']
-            
-            # Ajouter l'opération pour CRUD
-            if cle_scenario == "scenario1_crud" and 'operation' in record:
-                donnee_struct['operation'] = record['operation']
-            
-            if donnee_struct:  # Ne pas ajouter d'enregistrements vides
-                donnees_structurees[cle_scenario].append(donnee_struct)
+    union(tables: [
+    {pipelines}
+    ])
+    '''
     
-    return donnees_structurees
+    # Les enregistrements sont produits au fil de la lecture de la réponse ;
+    # une erreur est propagée pour permettre le repli par scénario
+    for record in client.query_api().query_stream(requete, org=INFLUX_ORG):
+        yield record.get_measurement(), record.values
 
-def calculer_moyennes_par_base(donnees_structurees):
-    """Calcule les moyennes par base de données"""
-    donnees_moyennes = {}
+def interroger_scenarios_en_parallele(plage_temps="-24h", client=None):
+    """Interroger chaque scénario séparément, en parallèle, quand la requête combinée échoue"""
+    def interroger(cle_scenario):
+        return [(cle_scenario, valeurs) for valeurs in interroger_donnees_scenario(cle_scenario, plage_temps, client)]
+    
+    with ThreadPoolExecutor(max_workers=len(SCENARIOS)) as executeur:
+        for enregistrements in executeur.map(interroger, SCENARIOS):
+            yield from enregistrements
+
+def extraire_donnees_structurees(enregistrements):
+    """Structure les moyennes d'InfluxDB, reçues en paires (scénario, enregistrement), pour l'analyse"""
+    donnees_structurees = {cle_scenario: [] for cle_scenario in SCENARIOS}
     
-    for cle_scenario, info_scenario in SCENARIOS.items():
-        donnees_moyennes[cle_scenario] = []
+    for cle_scenario, record in enregistrements:
+        donnee_struct = {}
         
-        # Grouper par base de données
-        donnees_par_base = {}
-        for record in donnees_structurees[cle_scenario]:
-            db = record.get('database', 'Inconnu')
-            if db not in donnees_par_base:
-                donnees_par_base[db] = {'count': 0, 'values': {}}
-            
-            # Pour CRUD, grouper aussi par opération
-            if cle_scenario == "scenario1_crud":
-                op = record.get('operation', 'unknown')
-                key = f"{db}_{op}"
-            else:
-                key = db
-            
-            if key not in donnees_par_base[db]['values']:
-                donnees_par_base[db]['values'][key] = {}
-            
-            # Accumuler les valeurs
-            for champ in info_scenario['champs']:
-                if champ in record and record[champ] is not None:
-                    if champ not in donnees_par_base[db]['values'][key]:
-                        donnees_par_base[db]['values'][key][champ] = []
-                    donnees_par_base[db]['values'][key][champ].append(record[champ])
-            donnees_par_base[db]['count'] += 1
+        # Copier les champs pertinents
+        for champ in SCENARIOS[cle_scenario]['champs']:
+            if record.get(champ) is not None:
+                donnee_struct[champ] = record[champ]
         
-        # Calculer les moyennes
-        for db, data in donnees_par_base.items():
-            for key, valeurs in data['values'].items():
-                record_moyen = {'database': db}
-                
-                if cle_scenario == "scenario1_crud":
-                    # Extraire l'opération de la clé
-                    parts = key.split('_')
-                    if len(parts) > 1:
-                        record_moyen['operation'] = parts[1]
-                
-                for champ, vals in valeurs.items():
-                    if vals:
-                        record_moyen[champ] = sum(vals) / len(vals)
-                
-                donnees_moyennes[cle_scenario].append(record_moyen)
+        # Ajouter le nom de la base de données
+        if 'database' in record:
+            donnee_struct['database'] = record['database']
+        
+        # Ajouter l'opération pour CRUD
+        if cle_scenario == "scenario1_crud" and 'operation' in record:
+            donnee_struct['operation'] = record['operation']
+        
+        if donnee_struct:  # Ne pas ajouter d'enregistrements vides
+            donnees_structurees[cle_scenario].append(donnee_struct)
     
-    return donnees_moyennes
+    return donnees_structurees
 
-def creer_graphique_reel(donnees, cle_scenario, titre_graphique, etiquette_y, champ_metrique):
-    """Créer un graphique avec les VRAIES données d'InfluxDB et des couleurs"""
-    fig, ax = plt.subplots(figsize=(10, 5))
+def formater_valeur_barre(valeur):
+    """Formater la valeur affichée au-dessus d'une barre"""
+    if valeur > 1000:
+        return f'{valeur/1000:.1f}k'
+    if valeur > 100:
+        return f'{valeur:.0f}'
+    return f'{valeur:.2f}'
+
+def creer_figure_graphique():
+    """Créer la figure Agg réutilisée pour tous les graphiques du rapport"""
+    # Figure autonome sur le canevas Agg, sans passer par l'état global de pyplot
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    fig.add_subplot(111)
+    return fig
+
+@functools.lru_cache(maxsize=1)
+def image_sans_donnees():
+    """Produire une seule fois l'image PNG utilisée pour les graphiques sans données"""
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    fig.text(0.5, 0.5, "DONNÉES MANQUANTES", ha='center', va='center', fontsize=16, color='red')
     
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100, facecolor='white', edgecolor='none',
+                metadata=METADONNEES_PNG)
+    return buf.getvalue()
+
+def creer_graphique_reel(fig, donnees, cle_scenario, titre_graphique, etiquette_y, champ_metrique):
+    """Créer un graphique avec les VRAIES données d'InfluxDB et des couleurs"""
     # Extraire les données réelles pour le tracé
     bases_donnees = []
     valeurs = []
     
-    info_scenario = SCENARIOS[cle_scenario]
-    
     if cle_scenario == "scenario1_crud":
         # Pour CRUD, utiliser l'opération d'insertion pour le graphique
         for enregistrement in donnees[cle_scenario]:
@@ -232,30 +312,20 @@ def creer_graphique_reel(donnees, cle_scenario, titre_graphique, etiquette_y, ch
                     valeurs.append(enregistrement[champ_metrique])
                 vus.add(db)
     
-    # Si pas de données, afficher un message
+    # Si pas de données, renvoyer l'image d'attente sans rien tracer
     if len(bases_donnees) == 0 or len(valeurs) == 0:
-        bases_donnees = ["Pas de données"]
-        valeurs = [0]
-        ax.set_title(f"{titre_graphique} - DONNÉES MANQUANTES", fontsize=12, color='red')
-        couleurs = ['#cccccc']
-    else:
-        ax.set_title(titre_graphique, fontsize=14, pad=15, fontweight='bold', color='#2c3e50')
-        
-        # Palette de couleurs par type de scénario
-        palettes = {
-            "scenario1_crud": ['#3498db', '#2ecc71', '#e74c3c', '#f39c12'],  # Bleu, Vert, Rouge, Orange
-            "scenario2_iot": ['#9b59b6', '#1abc9c', '#34495e', '#d35400'],   # Violet, Turquoise, Gris foncé, Orange foncé
-            "scenario3_graph": ['#e74c3c', '#27ae60', '#8e44ad', '#f39c12'], # Rouge, Vert, Violet, Orange
-            "scenario4_keyvalue": ['#2c3e50', '#16a085', '#c0392b', '#7f8c8d'], # Noir, Vert foncé, Rouge foncé, Gris
-            "scenario5_fulltext": ['#2980b9', '#27ae60', '#8e44ad', '#f1c40f'], # Bleu, Vert, Violet, Jaune
-            "scenario6_scalability": ['#2c3e50', '#e74c3c', '#3498db', '#2ecc71'] # Noir, Rouge, Bleu, Vert
-        }
-        
-        palette = palettes.get(cle_scenario, ['#4a4a4a', '#7a7a7a', '#a1a1a1', '#c9c9c9'])
-        # Répéter la palette si nécessaire
-        couleurs = []
-        for i in range(len(bases_donnees)):
-            couleurs.append(palette[i % len(palette)])
+        return io.BytesIO(image_sans_donnees())
+    
+    # Réutiliser les axes de la figure partagée au lieu d'en recréer
+    ax = fig.axes[0]
+    ax.clear()
+    ax.set_title(titre_graphique, fontsize=14, pad=15, fontweight='bold', color='#2c3e50')
+    
+    palette = PALETTES_GRAPHIQUES.get(cle_scenario, PALETTE_PAR_DEFAUT)
+    # Répéter la palette si nécessaire
+    couleurs = []
+    for i in range(len(bases_donnees)):
+        couleurs.append(palette[i % len(palette)])
     
     # Créer les barres avec bordures
     barres = ax.bar(bases_donnees, valeurs, color=couleurs, width=0.6, edgecolor='white', linewidth=2)
@@ -266,23 +336,12 @@ def creer_graphique_reel(donnees, cle_scenario, titre_graphique, etiquette_y, ch
     
     # Valeurs sur les barres (seulement si nous avons des données réelles)
     if len(valeurs) > 0 and valeurs[0] != 0:
-        for barre, valeur in zip(barres, valeurs):
-            hauteur = barre.get_height()
-            # Afficher les valeurs avec format adapté
-            if valeur > 1000:
-                texte = f'{valeur/1000:.1f}k'
-            elif valeur > 100:
-                texte = f'{valeur:.0f}'
-            else:
-                texte = f'{valeur:.2f}'
-            
-            ax.text(barre.get_x() + barre.get_width()/2., hauteur + (hauteur*0.02),
-                    texte,
-                    ha='center', va='bottom', fontsize=10, fontweight='bold',
-                    color='#2c3e50')
+        ax.bar_label(barres, labels=[formater_valeur_barre(valeur) for valeur in valeurs],
+                     padding=3, fontsize=10, fontweight='bold', color='#2c3e50')
     
-    plt.xticks(rotation=0, ha='center', fontsize=10, fontweight='bold')
-    plt.yticks(fontsize=10)
+    for etiquette in ax.get_xticklabels():
+        etiquette.set(rotation=0, ha='center', fontsize=10, fontweight='bold')
+    ax.tick_params(axis='y', labelsize=10)
     
     # Grille subtile
     ax.grid(axis='y', alpha=0.3, linestyle='--', color='#cccccc')
@@ -295,18 +354,18 @@ def creer_graphique_reel(donnees, cle_scenario, titre_graphique, etiquette_y, ch
         spine.set_color('#dddddd')
         spine.set_linewidth(1)
     
-    plt.tight_layout()
+    # Marges fixes : évite le second rendu imposé par bbox_inches='tight'
+    fig.subplots_adjust(left=0.1, right=0.95, top=0.9, bottom=0.15)
     
-    # Sauvegarder avec haute qualité
+    # 100 dpi donnent ~150 dpi effectifs une fois l'image réduite à 6.5 pouces dans le PDF
+    # Un tampon par graphique : ReportLab ne lit l'image qu'au moment de doc.build
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=300, bbox_inches='tight', 
-                facecolor='white', edgecolor='none')
+    fig.savefig(buf, format='png', dpi=100, facecolor='white', edgecolor='none',
+                metadata=METADONNEES_PNG)
     buf.seek(0)
-    plt.close()
-    
     return buf
 
-def ajouter_en_tete_pied(canvas_doc, doc):
+def ajouter_en_tete_pied(canvas_doc, doc, date_rapport):
     """Ajouter un en-tête et un pied de page minimalistes"""
     canvas_doc.saveState()
     
@@ -317,13 +376,13 @@ def ajouter_en_tete_pied(canvas_doc, doc):
     
     # Ligne séparatrice
     canvas_doc.setLineWidth(0.5)
-    canvas_doc.setStrokeColor(colors.HexColor('#cccccc'))
+    canvas_doc.setStrokeColor(COULEUR_SEPARATEUR)
     canvas_doc.line(inch, 10.6*inch, 7.5*inch, 10.6*inch)
     
     # Pied de page
     canvas_doc.setFont("Helvetica", 8)
     canvas_doc.drawRightString(7.5*inch, 0.5*inch, f"Page {canvas_doc.getPageNumber()}")
-    canvas_doc.drawString(inch, 0.5*inch, f"{datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    canvas_doc.drawString(inch, 0.5*inch, date_rapport)
     
     canvas_doc.restoreState()
 
@@ -431,7 +490,7 @@ def generer_page_garde(histoire, styles, donnees_reelles):
     # Ligne séparatrice
     ligne = Table([[""]], colWidths=[6*inch])
     ligne.setStyle(TableStyle([
-        ('LINEABOVE', (0, 0), (0, 0), 1, colors.HexColor('#cccccc')),
+        ('LINEABOVE', (0, 0), (0, 0), 1, COULEUR_SEPARATEUR),
     ]))
     histoire.append(ligne)
     histoire.append(Spacer(1, 40))
@@ -457,6 +516,9 @@ def generer_analyse_scenario(histoire, styles, donnees):
     histoire.append(Paragraph("4. Scénarios de test - Données Réelles", styles['TitreSection']))
     histoire.append(Spacer(1, 20))
     
+    # Une seule figure pour les six graphiques
+    fig = creer_figure_graphique()
+    
     for i, (cle_scenario, info_scenario) in enumerate(SCENARIOS.items(), 1):
         histoire.append(Paragraph(f"4.{i} {info_scenario['nom']}", styles['TitreScenario']))
         histoire.append(Spacer(1, 8))
@@ -474,6 +536,9 @@ def generer_analyse_scenario(histoire, styles, donnees):
         
         # Tableau avec données réelles
         if cle_scenario == "scenario1_crud":
+            # Index des moyennes par (base, opération)
+            index = {(d.get("database"), d.get("operation")): d for d in donnees[cle_scenario]}
+            
             # Tableau CRUD par opération
             for operation in info_scenario['operations']:
                 histoire.append(Paragraph(f"Opération {operation.upper()}", styles['TexteSimple']))
@@ -484,8 +549,7 @@ def generer_analyse_scenario(histoire, styles, donnees):
                 
                 for db in BASES_DE_DONNEES:
                     # Chercher les données pour cette base et cette opération
-                    donnee = next((d for d in donnees[cle_scenario] 
-                                 if d.get("database") == db and d.get("operation") == operation), None)
+                    donnee = index.get((db, operation))
                     
                     if donnee:
                         ligne = [
@@ -498,22 +562,8 @@ def generer_analyse_scenario(histoire, styles, donnees):
                         donnees_op.append(ligne)
                 
                 if len(donnees_op) > 1:  # Au moins une ligne de données
-                    tableau = Table(donnees_op, colWidths=[1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch])
-                    tableau.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, 0), (-1, -1), 9),
-                        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#eeeeee')),
-                        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-                        ('TOPPADDING', (0, 0), (-1, -1), 5),
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-                        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-                        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')])
-                    ]))
+                    tableau = Table(donnees_op, colWidths=LARGEURS_COLONNES_CRUD)
+                    tableau.setStyle(STYLE_TABLEAU_CRUD)
                     histoire.append(tableau)
                     histoire.append(Spacer(1, 12))
         else:
@@ -536,11 +586,13 @@ def generer_analyse_scenario(histoire, styles, donnees):
             
             donnees_tableau = [entetes]
             
+            # Index des moyennes par base
+            index = {d.get("database"): d for d in donnees[cle_scenario]}
+            
             # Ajouter les données par base
             for db in BASES_DE_DONNEES:
                 # Chercher les données pour cette base
-                donnee = next((d for d in donnees[cle_scenario] 
-                             if d.get("database") == db), None)
+                donnee = index.get(db)
                 
                 if donnee:
                     ligne = [db]
@@ -571,29 +623,8 @@ def generer_analyse_scenario(histoire, styles, donnees):
                     donnees_tableau.append(ligne)
             
             if len(donnees_tableau) > 1:  # Au moins une ligne de données
-                # Définir les largeurs de colonnes selon le scénario
-                if cle_scenario == "scenario2_iot":
-                    col_widths = [1.2*inch, 1.1*inch, 1.3*inch, 1.3*inch, 1.0*inch, 1.0*inch]
-                else:
-                    col_widths = [1.2*inch] + [1.5*inch]*(len(entetes)-1)
-                
-                tableau = Table(donnees_tableau, colWidths=col_widths)
-                tableau.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 9),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dddddd')),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-                    ('TOPPADDING', (0, 0), (-1, -1), 5),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-                    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-                    ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    # Alternance de couleurs pour les lignes
-                    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')])
-                ]))
+                tableau = Table(donnees_tableau, colWidths=LARGEURS_COLONNES[cle_scenario])
+                tableau.setStyle(STYLE_TABLEAU_SCENARIO)
                 histoire.append(tableau)
                 histoire.append(Spacer(1, 15))
         
@@ -613,7 +644,7 @@ def generer_analyse_scenario(histoire, styles, donnees):
             else:
                 champ, etiq = "throughput_ops", "ops/sec"
             
-            graphique = creer_graphique_reel(donnees, cle_scenario, 
+            graphique = creer_graphique_reel(fig, donnees, cle_scenario, 
                                            info_scenario['nom'], etiq, champ)
             img = Image(graphique, width=6.5*inch, height=3.5*inch)
             histoire.append(img)
@@ -622,21 +653,22 @@ def generer_analyse_scenario(histoire, styles, donnees):
             print(f"Graphique non généré pour {cle_scenario}: {e}")
         
         histoire.append(PageBreak())
+    
+    fig.clear()
 
-def generer_rapport_pdf():
-    """Générer un rapport PDF avec les VRAIES données d'InfluxDB"""
+def generer_rapport_pdf(client=None):
+    """Générer un rapport PDF avec les VRAIES données d'InfluxDB (client fourni ou client du module)"""
     print("📊 Récupération des données depuis InfluxDB...")
     
-    # Récupérer les VRAIES données d'InfluxDB
-    donnees_brutes = {}
-    for cle_scenario in SCENARIOS.keys():
-        print(f"  • Récupération {cle_scenario}...")
-        donnees_brutes[cle_scenario] = interroger_donnees_scenario(cle_scenario)
-    
-    # Structurer et calculer les moyennes
-    print("📈 Traitement des données...")
-    donnees_structurees = extraire_donnees_structurees(donnees_brutes)
-    donnees = calculer_moyennes_par_base(donnees_structurees)
+    # Récupérer les VRAIES données d'InfluxDB, tous les scénarios en une requête
+    # lue au fil de l'eau et structurée en un seul passage
+    try:
+        donnees = extraire_donnees_structurees(interroger_tous_les_scenarios(client=client))
+    except Exception as e:
+        print(f"⚠️ Requête combinée impossible ({e}), interrogation des scénarios en parallèle")
+        donnees = extraire_donnees_structurees(interroger_scenarios_en_parallele(client=client))
+    for cle_scenario, resultats in donnees.items():
+        print(f"✅ Données récupérées pour {cle_scenario}: {len(resultats)} moyennes")
     
     # Créer le dossier results
     chemin_results = os.path.join(os.getcwd(), "results")
@@ -645,7 +677,8 @@ def generer_rapport_pdf():
         print(f"Dossier créé : {chemin_results}")
     
     # Créer le nom de fichier avec timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    maintenant = datetime.now()
+    timestamp = maintenant.strftime("%Y%m%d_%H%M%S")
     nom_fichier = f"rapport_benchmark_reel_{timestamp}.pdf"
     chemin_complet = os.path.join(chemin_results, nom_fichier)
     
@@ -668,10 +701,10 @@ def generer_rapport_pdf():
     
     # Statistiques
     total_scenarios = len(SCENARIOS)
-    scenarios_avec_donnees = sum(1 for s in SCENARIOS if donnees_brutes.get(s) and len(donnees_brutes[s]) > 0)
+    scenarios_avec_donnees = sum(1 for s in SCENARIOS if donnees.get(s))
     
     info_data = [
-        ["Date", datetime.now().strftime('%d %B %Y %H:%M')],
+        ["Date", maintenant.strftime('%d %B %Y %H:%M')],
         ["Source", "InfluxDB"],
         ["Bucket", INFLUX_BUCKET],
         ["Scénarios avec données", f"{scenarios_avec_donnees}/{total_scenarios}"],
@@ -709,7 +742,9 @@ def generer_rapport_pdf():
     ))
     
     # Générer le PDF
-    doc.build(histoire, onFirstPage=ajouter_en_tete_pied, onLaterPages=ajouter_en_tete_pied)
+    # Date du pied de page formatée une fois pour toutes les pages
+    en_tete_pied = functools.partial(ajouter_en_tete_pied, date_rapport=maintenant.strftime('%d/%m/%Y %H:%M'))
+    doc.build(histoire, onFirstPage=en_tete_pied, onLaterPages=en_tete_pied)
     
     print(f"\n✅ Rapport PDF généré avec DONNÉES RÉELLES : {chemin_complet}")
     return chemin_complet
@@ -721,7 +756,4 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"❌ Erreur lors de la génération du rapport : {e}")
         import traceback
-        traceback.print_exc()
-    finally:
-        if influx_available:
-            client.close()
\ No newline at end of file
+        traceback.print_exc()
\ No newline at end of file
@@ -5,12 +5,13 @@ Usage: streamlit run visualize_results.py
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from influxdb_client import InfluxDBClient
+from influxdb_client import InfluxDBClient, Dialect
 from dotenv import load_dotenv
+import io
 import os
+import re
 from datetime import datetime, timedelta
 import numpy as np
 
@@ -34,6 +35,23 @@ INFLUX_BUCKET = os.getenv("INFLUX_BUCKET", "bench")
 # Noms des bases de données
 DATABASES = ["MongoDB", "Redis", "Cassandra", "Neo4j"]
 
+# Réponses CSV sans lignes d'annotation, lues directement par pandas
+CSV_DIALECT = Dialect(header=True, delimiter=",", annotations=[], date_time_format="RFC3339")
+
+# Colonnes propres au protocole Flux, inutiles côté client
+FLUX_CSV_COLUMNS = {'result', 'table'}
+
+# Nombre maximal de points envoyés au navigateur par courbe temporelle
+MAX_POINTS_PER_TRACE = 1000
+
+# Couleurs pour chaque base de données
+COLORS = {
+    'MongoDB': '#4CAF50',
+    'Redis': '#F44336',
+    'Cassandra': '#2196F3',
+    'Neo4j': '#9C27B0'
+}
+
 # Configurations des scénarios
 SCENARIOS = {
     "scenario1_crud": {
@@ -65,54 +83,191 @@ SCENARIOS = {
     "scenario6_scalability": {
         "name": "Test de Scalabilité",
         "description": "Analyse des opérations multi-thread et des charges concurrentes",
-        "fields": ["create_time", "read_time", "update_time", "delete_time", "throughput_ops"]
+        # Champs écrits par scenario6_scalability.py : threads_{N}_{mesure} pour chaque nombre de threads
+        "fields": [f"threads_{threads}_{metric}"
+                   for metric in ("time", "throughput", "cpu", "mem", "total_ops")
+                   for threads in (1, 5, 10, 20, 50)]
     }
 }
 
+# Types catégoriels : les filtres et regroupements travaillent sur des codes entiers
+DATABASE_DTYPE = pd.CategoricalDtype(DATABASES)
+OPERATION_DTYPE = pd.CategoricalDtype(SCENARIOS["scenario1_crud"]["operations"])
+
+# Requêtes brutes de chaque scénario, construites une seule fois ; seule la période varie.
+# Seuls les champs déclarés du scénario sont pivotés.
+SCENARIO_QUERIES = {
+    key: f'''
+    from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: {{time_range}})
+      |> filter(fn: (r) => r["_measurement"] == "{key}")
+      |> filter(fn: (r) => contains(value: r["_field"], set: [{", ".join(f'"{field}"' for field in info["fields"])}]))
+      |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> drop(columns: ["_start", "_stop", "_measurement"])
+    '''
+    for key, info in SCENARIOS.items()
+}
+
 @st.cache_resource
 def get_influx_client():
     """Initialiser le client InfluxDB avec cache"""
     try:
-        client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+        client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, enable_gzip=True)
         return client, client.query_api()
     except Exception as e:
         st.error(f"Erreur de connexion à InfluxDB: {e}")
         return None, None
 
-def query_scenario_data(_query_api, scenario_name, time_range="-24h"):
+def read_flux_csv(text, dtype=None):
+    """Lire une réponse CSV Flux sans annotations ; chaque bloc séparé par une ligne vide a son propre en-tête"""
+    frames = []
+    for block in re.split(r'\r?\n\r?\n', text):
+        if not block.strip():
+            continue
+        # La première colonne (vide) est réservée aux annotations
+        frame = pd.read_csv(
+            io.StringIO(block),
+            usecols=lambda column: column not in FLUX_CSV_COLUMNS and not column.startswith('Unnamed:'),
+            dtype=dtype
+        )
+        if 'error' in frame.columns and 'reference' in frame.columns:
+            raise RuntimeError(frame['error'].iloc[0])
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_data_frame(query, dtype=None):
+    """Exécuter une requête Flux et mettre le DataFrame en cache (les erreurs ne sont pas mises en cache)"""
+    client, query_api = get_influx_client()
+    # Réponse CSV brute lue directement par pandas, sans objet par enregistrement
+    response = query_api.query_raw(query, org=INFLUX_ORG, dialect=CSV_DIALECT)
+    return read_flux_csv(response.data.decode('utf-8'), dtype=dtype)
+
+def query_scenario_data(scenario_name, time_range="-24h"):
     """Interroger les données d'un scénario depuis InfluxDB"""
+    query = SCENARIO_QUERIES[scenario_name].format(time_range=time_range)
+    # Les champs entiers (ex. throughput_ops) seraient sinon lus en int64
+    dtype = {field: 'float64' for field in SCENARIOS[scenario_name]['fields']}
+    
+    try:
+        return fetch_data_frame(query, dtype)
+    except Exception as e:
+        st.error(f"Erreur lors de la requête {scenario_name}: {e}")
+        return pd.DataFrame()
+
+def query_scenario_aggregates(scenario_name, metric, operation=None, time_range="-24h"):
+    """Calculer dans InfluxDB la moyenne, le min, le max et l'écart-type d'une métrique par base"""
+    operation_filter = f'\n      |> filter(fn: (r) => r["operation"] == "{operation}")' if operation else ""
     query = f'''
-    from(bucket: "{INFLUX_BUCKET}")
+    data = from(bucket: "{INFLUX_BUCKET}")
       |> range(start: {time_range})
       |> filter(fn: (r) => r["_measurement"] == "{scenario_name}")
-      |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> filter(fn: (r) => r["_field"] == "{metric}"){operation_filter}
+      |> group(columns: ["database"])
+    
+    union(tables: [
+        data |> mean() |> set(key: "_stat", value: "mean"),
+        data |> min() |> set(key: "_stat", value: "min"),
+        data |> max() |> set(key: "_stat", value: "max"),
+        data |> stddev() |> set(key: "_stat", value: "std")
+    ])
+      |> group()
+      |> pivot(rowKey: ["database"], columnKey: ["_stat"], valueColumn: "_value")
     '''
     
     try:
-        tables = _query_api.query(query, org=INFLUX_ORG)
-        results = []
-        for table in tables:
-            for record in table.records:
-                results.append(record.values)
-        return results
+        df = fetch_data_frame(query)
+        if df.empty:
+            return df
+        return df.set_index('database').reindex(columns=['mean', 'min', 'max', 'std']).sort_index()
     except Exception as e:
         st.error(f"Erreur lors de la requête {scenario_name}: {e}")
-        return []
-
-def convert_to_dataframe(data):
-    """Convertir les données en DataFrame"""
-    if not data:
         return pd.DataFrame()
+
+def query_measurement_counts(time_range="-24h"):
+    """Compter dans InfluxDB le nombre de mesures de chaque scénario, en une seule requête"""
+    # Sans _field ni _value, les champs d'un même point se retrouvent dans une seule table par série :
+    # chaque horodatage distinct y correspond à une ligne, quels que soient les champs écrits
+    measurement_set = ", ".join(f'"{key}"' for key in SCENARIOS)
+    query = f'''
+    from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: {time_range})
+      |> filter(fn: (r) => contains(value: r["_measurement"], set: [{measurement_set}]))
+      |> drop(columns: ["_field", "_value"])
+      |> unique(column: "_time")
+      |> count(column: "_time")
+      |> group(columns: ["_measurement"])
+      |> sum(column: "_time")
+    '''
     
-    df = pd.DataFrame(data)
+    try:
+        df = fetch_data_frame(query)
+        if df.empty:
+            return {}
+        return dict(zip(df['_measurement'], df['_time'].astype(int)))
+    except Exception as e:
+        st.error(f"Erreur lors du comptage des mesures: {e}")
+        return {}
+
+def convert_to_dataframe(df, fields=()):
+    """Préparer le DataFrame pour l'affichage"""
+    if df.empty:
+        return df
     
     # Convertir les timestamps
     if '_time' in df.columns:
-        df['_time'] = pd.to_datetime(df['_time'])
+        # InfluxDB supprime les zéros finaux des fractions de seconde : formats ISO 8601 mixtes
+        df['_time'] = pd.to_datetime(df['_time'], format='ISO8601', utc=True)
         df = df.sort_values('_time')
     
+    # Tags en catégories
+    if 'database' in df.columns:
+        df['database'] = df['database'].astype(DATABASE_DTYPE)
+    if 'operation' in df.columns:
+        df['operation'] = df['operation'].astype(OPERATION_DTYPE)
+    
+    # Champs déclarés du scénario en float32 : précision suffisante pour l'affichage
+    fields = [field for field in fields if field in df.columns]
+    df[fields] = df[fields].astype('float32')
+    
     return df
 
+def downsample_lttb(data, y_label, n_out=MAX_POINTS_PER_TRACE):
+    """Réduire une série temporelle à n_out points avec l'algorithme LTTB (Largest-Triangle-Three-Buckets)"""
+    # Séries courtes inchangées : les valeurs manquantes restent des trous dans la courbe
+    if len(data) <= n_out:
+        return data
+    
+    data = data.dropna(subset=[y_label])
+    n = len(data)
+    if n <= n_out:
+        return data
+    
+    t = data['_time'].to_numpy(dtype='datetime64[ns]').astype('int64')
+    x = (t - t[0]) / 1e9
+    y = data[y_label].to_numpy(dtype=float)
+    
+    # Premier et dernier points conservés, n_out - 2 seaux entre les deux
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Sommet de référence : moyenne du seau suivant (ou dernier point)
+        if i < n_out - 3:
+            next_end = edges[i + 2]
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        # Garder le point qui forme le plus grand triangle avec le précédent et la référence
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(areas.argmax())
+        indices[i + 1] = a
+    
+    return data.iloc[indices]
+
 def create_comparison_chart(data, title, y_label, lower_better=True):
     """Créer un graphique de comparaison"""
     if data.empty:
@@ -120,23 +275,20 @@ def create_comparison_chart(data, title, y_label, lower_better=True):
     
     fig = go.Figure()
     
-    # Couleurs pour chaque base de données
-    colors = {
-        'MongoDB': '#4CAF50',
-        'Redis': '#F44336',
-        'Cassandra': '#2196F3',
-        'Neo4j': '#9C27B0'
-    }
+    # Un seul partitionnement par base au lieu d'un masque par base
+    groups = dict(tuple(data.groupby('database', sort=False, observed=True)))
     
     for db in DATABASES:
-        db_data = data[data['database'] == db]
-        if not db_data.empty:
+        db_data = groups.get(db)
+        if db_data is not None:
+            # Nombre de points par trace borné, quelle que soit la période interrogée
+            db_data = downsample_lttb(db_data, y_label)
             fig.add_trace(go.Scatter(
                 x=db_data['_time'],
                 y=db_data[y_label],
                 name=db,
                 mode='lines+markers',
-                line=dict(color=colors.get(db, '#666'), width=2),
+                line=dict(color=COLORS.get(db, '#666'), width=2),
                 marker=dict(size=8),
                 hovertemplate=f'<b>{db}</b><br>Temps: %{{x}}<br>{y_label}: %{{y:.2f}}<extra></extra>'
             ))
@@ -159,24 +311,18 @@ def create_bar_comparison(data, metric, title):
         return None
     
     # Calculer la moyenne par base de données
-    summary = data.groupby('database')[metric].mean().reset_index()
+    summary = data.groupby('database', observed=True)[metric].mean()
+    databases = list(summary.index)
     
-    fig = px.bar(
-        summary,
-        x='database',
-        y=metric,
-        color='database',
-        title=title,
-        text_auto='.2f',
-        color_discrete_map={
-            'MongoDB': '#4CAF50',
-            'Redis': '#F44336',
-            'Cassandra': '#2196F3',
-            'Neo4j': '#9C27B0'
-        }
-    )
+    fig = go.Figure(go.Bar(
+        x=databases,
+        y=summary.to_numpy(),
+        marker_color=[COLORS.get(db, '#666') for db in databases],
+        texttemplate='%{y:.2f}'
+    ))
     
     fig.update_layout(
+        title=title,
         xaxis_title="Base de données",
         yaxis_title=metric,
         template="plotly_white",
@@ -201,16 +347,11 @@ def display_summary_stats():
     
     col1, col2, col3, col4 = st.columns(4)
     
-    # Compter les scénarios avec données
-    scenarios_with_data = 0
-    total_measurements = 0
-    
     with st.spinner("Chargement des données..."):
-        for scenario_key in SCENARIOS.keys():
-            data = query_scenario_data(query_api, scenario_key)
-            if data:
-                scenarios_with_data += 1
-                total_measurements += len(data)
+        # Compter les scénarios avec données, sans rapatrier les points bruts
+        counts = query_measurement_counts()
+        scenarios_with_data = sum(1 for key in SCENARIOS if counts.get(key))
+        total_measurements = sum(counts.get(key, 0) for key in SCENARIOS)
         
         with col1:
             st.metric("Scénarios avec données", f"{scenarios_with_data}/{len(SCENARIOS)}")
@@ -245,13 +386,14 @@ def display_scenario_analysis():
     st.write(scenario_info['description'])
     
     # Charger les données
-    data = query_scenario_data(query_api, selected_scenario, "-24h")
+    data = query_scenario_data(selected_scenario, "-24h")
     
-    if not data:
+    if data.empty:
         st.warning("⚠️ Aucune donnée disponible pour ce scénario")
         return
     
-    df = convert_to_dataframe(data)
+    df = convert_to_dataframe(data, scenario_info['fields'])
+    columns = set(df.columns)
     
     # Afficher les données brutes
     with st.expander("📋 Données brutes"):
@@ -281,7 +423,7 @@ def display_scenario_analysis():
         metrics_to_show = scenario_info['fields'][:3]
         
         for idx, metric in enumerate(metrics_to_show):
-            if metric in df.columns:
+            if metric in columns:
                 with cols[idx]:
                     avg_value = df[metric].mean()
                     unit = "ms" if "latency" in metric else "s" if "time" in metric else "ops/sec" if "throughput" in metric else "%"
@@ -300,21 +442,21 @@ def display_scenario_analysis():
             subplot_titles=[op.upper() for op in scenario_info['operations']]
         )
         
+        # Moyennes par (opération, base) calculées en un seul regroupement
+        latency_means = df.groupby(['operation', 'database'], observed=True)['latency_ms'].mean()
+        
         for idx, op in enumerate(scenario_info['operations'], 1):
-            op_data = df[df['operation'] == op]
-            if not op_data.empty:
-                for db in DATABASES:
-                    db_op_data = op_data[op_data['database'] == db]
-                    if not db_op_data.empty:
-                        fig.add_trace(
-                            go.Bar(
-                                x=[db],
-                                y=[db_op_data['latency_ms'].mean()],
-                                name=f"{db} - {op}",
-                                showlegend=(idx == 1)
-                            ),
-                            row=1, col=idx
-                        )
+            for db in DATABASES:
+                if (op, db) in latency_means.index:
+                    fig.add_trace(
+                        go.Bar(
+                            x=[db],
+                            y=[latency_means[(op, db)]],
+                            name=f"{db} - {op}",
+                            showlegend=(idx == 1)
+                        ),
+                        row=1, col=idx
+                    )
         
         fig.update_layout(
             title="Latence CRUD par opération",
@@ -329,16 +471,16 @@ def display_scenario_analysis():
         
         with col1:
             # Graphique temporel
-            if 'latency_ms' in df.columns or 'search_latency' in df.columns:
-                metric = 'latency_ms' if 'latency_ms' in df.columns else 'search_latency'
+            if 'latency_ms' in columns or 'search_latency' in columns:
+                metric = 'latency_ms' if 'latency_ms' in columns else 'search_latency'
                 fig_time = create_comparison_chart(df, "Évolution dans le temps", metric)
                 if fig_time:
                     st.plotly_chart(fig_time, use_container_width=True)
         
         with col2:
             # Graphique à barres
-            if 'throughput_ops' in df.columns or 'insert_throughput' in df.columns:
-                metric = 'throughput_ops' if 'throughput_ops' in df.columns else 'insert_throughput'
+            if 'throughput_ops' in columns or 'insert_throughput' in columns:
+                metric = 'throughput_ops' if 'throughput_ops' in columns else 'insert_throughput'
                 fig_bar = create_bar_comparison(df, metric, "Débit de traitement")
                 if fig_bar:
                     st.plotly_chart(fig_bar, use_container_width=True)
@@ -371,49 +513,57 @@ def display_comparison_dashboard():
             format_func=lambda x: x.replace('_', ' ').title()
         )
     
-    # Charger les données
-    data = query_scenario_data(query_api, selected_scenario, "-24h")
-    
-    if not data:
-        st.warning("Aucune donnée disponible pour cette comparaison")
-        return
-    
-    df = convert_to_dataframe(data)
-    
-    # Tableau de comparaison
-    st.subheader("📊 Tableau comparatif")
-    
     if selected_scenario == "scenario1_crud":
-        # Pour CRUD, afficher par opération
+        # Statistiques calculées par InfluxDB pour l'opération choisie
         operation = st.selectbox("Opération:", scenario_info['operations'])
-        op_data = df[df['operation'] == operation]
+        summary = query_scenario_aggregates(selected_scenario, selected_metric, operation)
         
-        if not op_data.empty:
-            summary = op_data.groupby('database')[selected_metric].agg(['mean', 'min', 'max', 'std']).round(2)
-            st.dataframe(summary, use_container_width=True)
-            
-            # Graphique radar
-            radar_data = op_data.groupby('database')[selected_metric].mean().reset_index()
-            fig_radar = px.line_polar(
-                radar_data,
-                r=selected_metric,
-                theta='database',
-                line_close=True,
-                title=f"Comparaison {selected_metric} - {operation.upper()}"
-            )
-            st.plotly_chart(fig_radar, use_container_width=True)
+        if summary.empty:
+            st.warning("Aucune donnée disponible pour cette comparaison")
+            return
+        
+        # Tableau de comparaison
+        st.subheader("📊 Tableau comparatif")
+        st.dataframe(summary.round(2), use_container_width=True)
+        
+        # Graphique radar
+        means = summary['mean'].reindex(DATABASES).dropna()
+        # Refermer le polygone en répétant le premier point
+        fig_radar = go.Figure(go.Scatterpolar(
+            r=list(means.values) + list(means.values[:1]),
+            theta=list(means.index) + list(means.index[:1]),
+            mode='lines',
+            name=selected_metric
+        ))
+        fig_radar.update_layout(title=f"Comparaison {selected_metric} - {operation.upper()}")
+        st.plotly_chart(fig_radar, use_container_width=True)
     else:
-        # Pour les autres scénarios
-        summary = df.groupby('database')[selected_metric].agg(['mean', 'min', 'max', 'std']).round(2)
-        st.dataframe(summary, use_container_width=True)
+        # Statistiques calculées par InfluxDB, points bruts seulement pour la distribution
+        summary = query_scenario_aggregates(selected_scenario, selected_metric)
+        data = query_scenario_data(selected_scenario, "-24h")
+        
+        if summary.empty or data.empty:
+            st.warning("Aucune donnée disponible pour cette comparaison")
+            return
+        
+        df = convert_to_dataframe(data, scenario_info['fields'])
+        
+        # Tableau de comparaison
+        st.subheader("📊 Tableau comparatif")
+        st.dataframe(summary.round(2), use_container_width=True)
         
         # Graphique en boîte
-        fig_box = px.box(
-            df,
-            x='database',
-            y=selected_metric,
-            color='database',
-            title=f"Distribution de {selected_metric}"
+        fig_box = go.Figure()
+        for db, db_data in df.groupby('database', observed=True):
+            fig_box.add_trace(go.Box(
+                y=db_data[selected_metric],
+                name=db,
+                marker_color=COLORS.get(db, '#666')
+            ))
+        fig_box.update_layout(
+            title=f"Distribution de {selected_metric}",
+            xaxis_title="database",
+            yaxis_title=selected_metric
         )
         st.plotly_chart(fig_box, use_container_width=True)
 
@@ -480,7 +630,7 @@ def main():
         
         # Rafraîchir les données
         if st.button("🔄 Rafraîchir les données"):
-            st.cache_resource.clear()
+            st.cache_data.clear()
             st.rerun()
     
     # Contenu principal